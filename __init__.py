@@ -60,21 +60,3 @@ def get_debug_info(locals: dict) -> dict:
     #if weather_mod and xkcd_mod:
     #    weather_debug = weather_mod._module.get_debug_info(None)
     return None
-    return {
-        "last_topic_time": last_topic_time,
-        "state": state,
-        "extruder_temp": extruder_temp,
-        "extruder_target": extruder_target,
-        "bed_temp": bed_temp,
-        "bed_target": bed_target,
-        "state": state,
-        "progress": progress,
-        "print_time": print_time,
-        "remaining_time": remaining_time,
-        "estimated_print_time": estimated_print_time,
-        "last_print_time": last_print_time,
-        "file_name": file_name,
-        "filemant_length": filemant_length,
-        "weather_active": state is None or state == "",
-        "weather_debug": weather_debug
-    }
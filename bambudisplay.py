@@ -27,9 +27,13 @@ import time
 import re
 import sys
 import datetime
+import functools
 import threading
 import pymirror
 import pygame
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 try:
     import bambulab.pybambu
@@ -48,15 +52,81 @@ import asyncio
 import bambulab.remiapp as remiapp
 
 remi_port: int = 30000
-remi_qr_file: str = "/tmp/remiqr.png"
 
 logger = logging.getLogger("bambulab")
 
 qr_code_width: int = 250
 
+# The cloud may well be unreachable at boot, the cloud check is attempted this many times this far apart
+cloud_check_retries: int = 10
+cloud_check_retry_delay: float = 30.0
+
+# Printer states and job names use underscores for spaces
+_UNDERSCORE_TBL: dict[int, int] = str.maketrans("_", " ")
+
+# AMS tray colors are reported as RRGGBBAA
+_COLOR_RE: re.Pattern = re.compile(r"^([a-fA-F0-9]{2})([a-fA-F0-9]{2})([a-fA-F0-9]{2})([a-fA-F0-9]{2})$")
+
+# Upper bound for the number of rendered text surfaces kept between frames
+text_cache_size: int = 128
+
+# Font file the mirror draws text with, None being pygame's default font
+font_file: str|None = None
+
+@functools.lru_cache(maxsize=16)
+def get_font(size: int) -> pygame.font.Font:
+    """Get the mirror's font in the given size, fonts are kept around as loading them is slow
+
+    Args:
+        size (int): Font size
+
+    Returns:
+        pygame.font.Font: The font
+    """
+    return pygame.font.Font(font_file, size)
+
+@functools.lru_cache(maxsize=text_cache_size)
+def render_text(text: str, size: int, color: tuple[int, int, int]) -> pygame.Surface:
+    """Render text to a surface. Most strings we draw change at most once a second
+    so the rendered surfaces are cached and reused across frames.
+
+    Args:
+        text (str): Text to render
+        size (int): Font size
+        color (tuple[int, int, int]): Text color
+
+    Returns:
+        pygame.Surface: The rendered text
+    """
+    return get_font(size).render(text, True, color)
+
 async def bambu_connect(c: bambulab.pybambu.BambuClient):
     """Pybambu init"""
-    await c.connect(None)
+    try:
+        await c.connect(None)
+    except Exception as e:
+        logger.error("Failed to connect to printer", exc_info=e)
+
+def setup_cloud_session(cloud: "bambulab.pybambu.BambuCloud", pool_maxsize: int = 4):
+    """Make the Bambu cloud client reuse connections between requests, saving a TLS
+    handshake on eg. every cover download and login request.
+
+    Args:
+        cloud (bambulab.pybambu.BambuCloud): Bambu cloud client
+        pool_maxsize (int, optional): Max number of pooled connections. Defaults to 4.
+    """
+    if not hasattr(cloud, "_session"):
+        logger.debug("Bambu cloud client does not use a session")
+        return
+    retry: Retry = Retry(total=3, backoff_factor=0.3)
+    if cloud._session is None:
+        session: requests.Session = requests.Session()
+        # Connections are all to the same host
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry))
+        cloud._session = session
+    elif isinstance(cloud._session, requests.Session):
+        # Keep the adapter already mounted, it may be doing more than we know (eg. Cloudflare handling)
+        cloud._session.get_adapter("https://").max_retries = retry
 
 def get_public_ip() -> str|None:
     """Fetch our public IP address, requires internet access
@@ -76,50 +146,162 @@ def get_public_ip() -> str|None:
     return ip
 
 
-def generate_remi_qr_code(url: str):
+def generate_remi_qr_code(url: str) -> pygame.Surface:
+    """Generate a QR code, white on black, straight into a surface
+
+    Args:
+        url (str): URL to encode
+
+    Returns:
+        pygame.Surface: The QR code, `qr_code_width` pixels wide
+    """
     import qrcode
-    img: qrcode.image.pil.PilImage = qrcode.make(url)
-    img.convert("RGB").save(remi_qr_file)
+    qr: qrcode.QRCode = qrcode.QRCode(border=2)
+    qr.add_data(url)
+    qr.make()
+    matrix: list[list[bool]] = qr.get_matrix()
+    pixels: bytes = bytes(255 if module else 0 for row in matrix for module in row for _ in range(3))
+    img: pygame.Surface = pygame.image.frombuffer(pixels, (len(matrix), len(matrix)), "RGB")
+    # Nearest neighbour scaling keeps the modules sharp
+    return pygame.transform.scale(img, (qr_code_width, qr_code_width))
 
 
 def bambu_download_cover_thread(bambu_display: "BambuDisplay"):
-    """Download cover for latest job from the cloud, save to `cover_fname` and update
-    `locals` for the main thread to learn that the cover is available
+    """Download cover for latest job from the cloud, save to `cover_fname`, load it and
+    update `bambu_display` for the main thread to learn that the cover is available.
+    The cover is loaded here as it may take time to scale it.
 
     Args:
         client (bambulab.pybambu.BambuClient): Bambu client
         locals (any): Module locals
     """
     logger.info("Downloading cover from the cloud")
-    cover_fname: str = f"/tmp/cover-{str(time.time())}.png"
+    bambu_display._cover_seq += 1
+    cover_fname: str = f"/tmp/cover-{bambu_display._cover_seq}.png"
     try:
         task = bambu_display._client.bambu_cloud.get_latest_task_for_printer(bambu_display._client._serial)
         cover: bytes = bambu_display._client.bambu_cloud.download(task["cover"])
         with open(cover_fname, "wb+") as f:
             f.write(cover)
         logger.info(f"🟢🟢🟢 Cover downloaded to {cover_fname} 🟢🟢🟢")
+        (image, w, h) = bambu_display._mirror.load_image(cover_fname, 512)
+        logger.info(f"Cover loaded")
         bambu_display._cover_fname = cover_fname
+        (bambu_display._cover_image, bambu_display._cover_w, bambu_display._cover_h) = (image, w, h)
+        # Set last so the main thread never sees a partially loaded cover
         bambu_display._cover_downloaded = True
     except Exception as e:
         logger.error("Bambu cover download caused exception", exc_info=e)
 
+def bambu_prepare_qr_code_thread(bambu_display: "BambuDisplay"):
+    """Generate the QR code leading to the REMI app into `bambu_display._qr_code`
+    for the main thread to draw
+
+    Args:
+        bambu_display (BambuDisplay): The Bambu display
+    """
+    try:
+        remi_url: str = f"http://{get_public_ip()}:{remi_port}"
+        bambu_display._qr_code = generate_remi_qr_code(remi_url).convert_alpha()
+        logger.info(f"REMI running on {remi_url}")
+    except Exception as e:
+        logger.error("Failed to prepare REMI QR code", exc_info=e)
+
+class FrameSurface:
+    """Stands in for the mirror while a frame is drawn. Everything is drawn to an offscreen
+    surface that is blitted to the mirror, and blitted again for as long as nothing on display
+    changes. Only the area drawn to is blitted as most of the surface is transparent.
+    """
+
+    def __init__(self, mirror: pymirror.Mirror):
+        self._mirror: pymirror.Mirror = mirror
+        self.surface: pygame.Surface = pygame.Surface((mirror.width, mirror.height), pygame.SRCALPHA).convert_alpha()
+        self._texts: list[tuple[tuple, dict]] = []  # Text drawn by the mirror on every flush
+        self._dirty: list[pygame.Rect] = []  # Areas drawn to since the last clear
+        self._dirty_area: pygame.Rect|None = None  # Their union, see `dirty_area`
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._mirror, name)
+
+    def blit_image(self, image: pygame.Surface, x: int, y: int):
+        self._dirty.append(self.surface.blit(image, (x, y)))
+
+    def blit_images(self, blits: list[tuple[pygame.Surface, tuple[int, int]]]):
+        """Blit a batch of images in one call
+
+        Args:
+            blits (list[tuple[pygame.Surface, tuple[int, int]]]): List of (image, (x, y))
+        """
+        if hasattr(self.surface, "fblits"):
+            self.surface.fblits(blits)  # pygame-ce, does not return the rects drawn to
+            bounds: pygame.Rect = self.surface.get_rect()
+            self._dirty.extend(image.get_rect(topleft=pos).clip(bounds) for (image, pos) in blits)
+        else:
+            self._dirty.extend(self.surface.blits(blits))
+
+    def draw_text(self, *args, **kwargs):
+        """Text that needs fitting to a width is left to the mirror, see `flush`"""
+        self._texts.append((args, kwargs))
+
+    def fill_rect(self, x: int, y: int, width: int, height: int, color: tuple[int, int, int]):
+        self._dirty.append(pygame.draw.rect(self.surface, color, (x, y, width, height)))
+
+    def draw_rect(self, x: int, y: int, width: int, height: int, color: tuple[int, int, int]):
+        self._dirty.append(pygame.draw.rect(self.surface, color, (x, y, width, height), 1))
+
+    def dirty_area(self) -> pygame.Rect|None:
+        """Get the area drawn to since the last clear, merged into one rect so the frame
+        is blitted in one go
+
+        Returns:
+            pygame.Rect|None: The area, None if nothing was drawn
+        """
+        if self._dirty_area is None and self._dirty:
+            self._dirty_area = self._dirty[0].unionall(self._dirty[1:])
+        return self._dirty_area
+
+    def clear(self):
+        """Clear the frame before drawing a new one"""
+        area: pygame.Rect|None = self.dirty_area()
+        if area:
+            self.surface.fill((0, 0, 0, 0), area)
+        self._dirty.clear()
+        self._dirty_area = None
+        self._texts.clear()
+
+    def flush(self):
+        """Blit the frame to the mirror"""
+        area: pygame.Rect|None = self.dirty_area()
+        if area:
+            self._mirror.blit_image(self.surface.subsurface(area), area.x, area.y)
+        for (args, kwargs) in self._texts:
+            self._mirror.draw_text(*args, **kwargs)
+
 class BambuDisplay:
     _config: dict[str: str|int] = None
 
     def __init__(self, mirror: pymirror, config: dict):
         self._config = config
+        self._mirror: pymirror.Mirror = mirror
         self._extruder_icon: pygame.Surface|None = None
         self._bed_icon: pygame.Surface|None = None
         self._humidity_icons: list[pygame.Surface] = []
         self._client: bambulab.pybambu.BambuClient
-        self._cloud_connected: bool = False  # Set to True once authenticated with the Bambu cloud
+        self._cloud_connected: bool|None = None  # Set to True once authenticated with the Bambu cloud, None until we know
         self._first_print_job_start = None
+        self._color_cache: dict[str, tuple[int, int, int, int]] = {}  # Parsed AMS tray colors, keyed on the raw color string
+        self._ams_layout_cache: dict[tuple[int, int], tuple[int, int, int, int, int]] = {}  # AMS layout keyed on (slot count, mirror width)
+        self._frame: FrameSurface = FrameSurface(mirror)  # The last frame drawn
+        self._frame_signature: tuple|None = None  # And the signature of what it shows
 
+        # Icons are converted to the display pixel format once here instead of on every blit
         (self._extruder_icon, _, _) = mirror.load_image("images/iconfinder_Extruder_SVG_981319.png", invert = True, width = 130)
+        self._extruder_icon = self._extruder_icon.convert_alpha()
         (self._bed_icon, _, _)  = mirror.load_image("images/iconfinder_Heated_Bed_Plate_SVG_981316.png", invert = True, width = 130)
+        self._bed_icon = self._bed_icon.convert_alpha()
         for i in range(0, 6):
             (temp, _, _)  = mirror.load_image(f"humidity-{i}.png", invert = True, width = 80)
-            self._humidity_icons.append(temp)
+            self._humidity_icons.append(temp.convert_alpha())
 
         self._device_type: str = config["device_type"]
         self._serial: str = config["serial"]
@@ -134,14 +316,16 @@ class BambuDisplay:
 
         self._print_job: PrintJob|None = None
         self._cover_downloaded: bool = False
+        self._cover_seq: int = 0  # Keeps cover file names unique
         self._cover_image: pygame.Surface|None = None
         self._print_job_start: datetime
+        self._print_job_start_epoch: int|None = None  # `_print_job_start` in seconds since the epoch
 
-        remi_url: str = f"http://{get_public_ip()}:{remi_port}"
-        generate_remi_qr_code(remi_url)
-        logger.info(f"REMI running on {remi_url}")
+        # The QR code needs network access to find our IP, prepare it while we connect to the printer
+        self._qr_code: pygame.Surface|None = None
+        t = threading.Thread(target=bambu_prepare_qr_code_thread, args=(self,), daemon=True)
+        t.start()
 
-        (self._qr_code, _, _)  = mirror.load_image(remi_qr_file, invert = True, width = qr_code_width)
         auth_token: str|None = None
         if self._token_path.is_file():
             logger.debug(f"Read auth token from {self._token_path}")
@@ -164,26 +348,44 @@ class BambuDisplay:
             client_config["auth_token"] = auth_token
 
         self._client: bambulab.pybambu.BambuClient = bambulab.pybambu.BambuClient(client_config)
+        # Shared by the cover download and the REMI login app
+        setup_cloud_session(self._client.bambu_cloud, pool_maxsize=4)
         # TODO: Attempt cloud connection and if failing, display a QR code leading to a remi app to enter the auth code
-        asyncio.run(bambu_connect(self._client))
-        self.update_cloud_state()
+        # Connect on a loop of our own so we can start drawing while connecting to the printer
+        self._loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(bambu_connect(self._client), self._loop)
+        # And check the cloud state at the same time
+        threading.Thread(target=self.update_cloud_state, daemon=True).start()
 
 
     def update_cloud_state(self):
         logger.info("☁️  Updating cloud status ☁️")
-        self._cloud_connected = False
-        try:
-            devices: list[dict[str: str|int]] = self._client.bambu_cloud.get_device_list()
-        except ValueError as e:
-            logger.error("⛈️ Not authenticated with Bambulab cloud API", exc_info=e)
-        else:
-            if devices is None:  # API is kinda undefined here...
-                logger.error("⛈️ Not authenticated with Bambulab cloud API")
+        connected: bool = False
+        for attempt in range(1, cloud_check_retries + 1):
+            try:
+                devices: list[dict[str: str|int]] = self._client.bambu_cloud.get_device_list()
+            except ValueError as e:
+                logger.error("⛈️ Not authenticated with Bambulab cloud API", exc_info=e)
+                break
+            except requests.RequestException as e:
+                # Eg. the network is not up yet
+                logger.warning(f"Failed to reach Bambulab cloud API, attempt {attempt} of {cloud_check_retries}", exc_info=e)
+                if attempt < cloud_check_retries:
+                    time.sleep(cloud_check_retry_delay)
+            except Exception as e:
+                logger.error("⛈️ Bambulab cloud API caused exception", exc_info=e)
+                break
             else:
-                logger.debug(f"Cloud Devices: {devices}")
-                if len(devices) > 0:
-                    self._cloud_connected = True
-                    logger.info(f"☀️  Connected to Bambu cloud, found {devices[0]['name']} {'🟢' if devices[0]['online'] else '🔴'}")
+                if devices is None:  # API is kinda undefined here...
+                    logger.error("⛈️ Not authenticated with Bambulab cloud API")
+                else:
+                    logger.debug(f"Cloud Devices: {devices}")
+                    if len(devices) > 0:
+                        connected = True
+                        logger.info(f"☀️  Connected to Bambu cloud, found {devices[0]['name']} {'🟢' if devices[0]['online'] else '🔴'}")
+                break
+        self._cloud_connected = connected
 
     def timestamp_to_hms(self, timestamp: int, skip_seconds: bool = False, counting_down: bool = False) -> str:
         """Convert a timestamp in seconds to an HMS representation of "XXh YYm ZZs"
@@ -195,33 +397,27 @@ class BambuDisplay:
         Returns:
             str -- HMS representation
         """
-        h: int = 0
-        m: int = 0
-        s: int = 0
-        timestamp = int(timestamp)
-        if timestamp >= 3600:
-            h = timestamp/3600
-            timestamp = timestamp%3600
-        if timestamp >= 60:
-            m = timestamp/60
-            timestamp = timestamp%60
-        s = timestamp
+        h: int
+        m: int
+        s: int
+        (h, s) = divmod(max(int(timestamp), 0), 3600)
+        (m, s) = divmod(s, 60)
 
         if h > 0:
             if skip_seconds:
-                return "%dh %02dm" % (h, m)
+                return f"{h}h {m:02d}m"
             else:
-                return "%dh %02dm %02ds" % (h, m, s)
+                return f"{h}h {m:02d}m {s:02d}s"
         elif m > 0:
             if skip_seconds:
-                return "%dm" % (m)
+                return f"{m}m"
             else:
-                return "%dm %02ds" % (m, s)
+                return f"{m}m {s:02d}s"
         elif s > 0:
             if skip_seconds:
                 return "< 1m"
             else:
-                return "%ds" % (s)
+                return f"{s}s"
         else:
             if skip_seconds:
                 if counting_down:
@@ -232,9 +428,54 @@ class BambuDisplay:
                 return "now"
 
 
-    def draw_ams(self, mirror: pymirror.Mirror):
-        device: Device = self._client.get_device()
-        if not device or not device.ams or len(device.ams.data) == 0 or device.ams.data[0] is None:
+    def text_blit(self, text: str, x: int, y: int, color: tuple[int, int, int] = (255,255,255), adjustment: pymirror.Adjustment = pymirror.Adjustment.Left, size: int = 70, width: int|None = None) -> tuple[pygame.Surface, tuple[int, int]]|None:
+        """Get a cached text surface and the position to blit it at, see `render_text`
+
+        Args:
+            text (str): Text to draw
+            x (int): X position, the anchor is given by `adjustment`
+            y (int): Y position
+            color (tuple[int, int, int], optional): Text color. Defaults to white.
+            adjustment (pymirror.Adjustment, optional): Horizontal adjustment. Defaults to pymirror.Adjustment.Left.
+            size (int, optional): Font size. Defaults to 70.
+            width (int|None, optional): Max width of the text. Defaults to None.
+
+        Returns:
+            tuple[pygame.Surface, tuple[int, int]]|None: Text surface and position, None if the
+            text is wider than `width` and needs to be fitted by the mirror
+        """
+        surface: pygame.Surface = render_text(text, size, tuple(color))
+        if width and surface.get_width() > width:
+            return None  # Leave fitting the text to the mirror
+        x = int(x)
+        if adjustment == pymirror.Adjustment.Center:
+            x -= surface.get_width() // 2
+        elif adjustment == pymirror.Adjustment.Right:
+            x -= surface.get_width()
+        return (surface, (x, int(y)))
+
+    def draw_text_cached(self, mirror: pymirror.Mirror, text: str, x: int, y: int, color: tuple[int, int, int] = (255,255,255), adjustment: pymirror.Adjustment = pymirror.Adjustment.Left, size: int = 70, width: int|None = None):
+        """Draw text using a cached surface if possible, see `text_blit`
+
+        Args:
+            mirror (pymirror.Mirror): The mirror
+            text (str): Text to draw
+            x (int): X position, the anchor is given by `adjustment`
+            y (int): Y position
+            color (tuple[int, int, int], optional): Text color. Defaults to white.
+            adjustment (pymirror.Adjustment, optional): Horizontal adjustment. Defaults to pymirror.Adjustment.Left.
+            size (int, optional): Font size. Defaults to 70.
+            width (int|None, optional): Max width of the text. Defaults to None.
+        """
+        blit: tuple[pygame.Surface, tuple[int, int]]|None = self.text_blit(text, x, y, color, adjustment, size, width)
+        if blit is None:
+            mirror.draw_text(text, x, y, color, adjustment = adjustment, size = size, width = width)
+        else:
+            (surface, (x, y)) = blit
+            mirror.blit_image(surface, x, y)
+
+    def draw_ams(self, mirror: FrameSurface, device: Device):
+        if not device.ams or len(device.ams.data) == 0 or device.ams.data[0] is None:
             # Either we have no AMS or we have not reveiced the complete AMS data yet.
             return
 
@@ -242,33 +483,43 @@ class BambuDisplay:
         # We subtract from 6 to match the new Bambu Handy/Studio presentation of 1 = dry, 5 = wet while the printer sends 1 = wet, 5 = dry
         ams_humidity = 6 - device.ams.data[0].humidity_index
 
+        # Images and text are collected and blitted in one go at the end
+        blits: list[tuple[pygame.Surface, tuple[int, int]]] = []
         try:
-            mirror.blit_image(self._humidity_icons[ams_humidity], mirror.width - 80, 9)
+            blits.append((self._humidity_icons[ams_humidity], (mirror.width - 80, 9)))
         except IndexError:
             pass
 
-        slot_width: int = 240
-        color_width: int = 75
-        color_height: int = 30
-        slot_spacing: int = 10
-        ams_width: int = slot_count * (slot_width + slot_spacing) - slot_spacing
-        x_start: int = (mirror.width - ams_width) // 2
+        layout: tuple[int, int, int, int, int]|None = self._ams_layout_cache.get((slot_count, mirror.width))
+        if layout is None:
+            slot_width: int = 240
+            color_width: int = 75
+            color_height: int = 30
+            slot_spacing: int = 10
+            ams_width: int = slot_count * (slot_width + slot_spacing) - slot_spacing
+            layout = ((mirror.width - ams_width) // 2, slot_width, color_width, color_height, slot_spacing)
+            self._ams_layout_cache[(slot_count, mirror.width)] = layout
+        (x_start, slot_width, color_width, color_height, slot_spacing) = layout
 
         tray: AMSTray
         index: int = 0
         for tray in device.ams.data[0].tray:
             x: int = x_start + (slot_width - color_width) // 2
             if not tray.empty:
-                m = re.match("^([a-fA-F0-9]{2})([a-fA-F0-9]{2})([a-fA-F0-9]{2})([a-fA-F0-9]{2})$", tray.color)
-                if m:
-                    r = int(m[1], 16)
-                    g = int(m[2], 16)
-                    b = int(m[3], 16)
-                    a = int(m[4], 16)
+                rgba: tuple[int, int, int, int]|None = self._color_cache.get(tray.color)
+                if rgba is None:
+                    if tray.color and _COLOR_RE.match(tray.color):
+                        rgba = tuple(bytes.fromhex(tray.color))
+                    else:
+                        rgba = (0, 0, 0, 0)
+                    self._color_cache[tray.color] = rgba
+                (r, g, b, a) = rgba
+
+                blit: tuple[pygame.Surface, tuple[int, int]]|None = self.text_blit(f"{tray.name}", x_start+slot_width//2, 60, adjustment = pymirror.Adjustment.Center, size = 40, width=slot_width)
+                if blit is None:
+                    mirror.draw_text(f"{tray.name}", x_start+slot_width//2, 60, adjustment = pymirror.Adjustment.Center, size = 40, width=slot_width)
                 else:
-                    r = g = b = a = 0
-
-                mirror.draw_text(f"{tray.name}", x_start+slot_width//2, 60, adjustment = pymirror.Adjustment.Center, size = 40, width=slot_width)
+                    blits.append(blit)
                 if not tray.empty:
                     mirror.fill_rect(x, 2, color_width, color_height, (r,g,b))
                     if index == device.ams.tray_now:
@@ -276,12 +527,42 @@ class BambuDisplay:
                 else:
                     mirror.draw_rect(x, 2, color_width, color_height, (128,128,128))
             else:
-                mirror.draw_text(f"Empty", x_start+slot_width//2, 60, adjustment = pymirror.Adjustment.Center, size = 40)
+                blits.append(self.text_blit(f"Empty", x_start+slot_width//2, 60, adjustment = pymirror.Adjustment.Center, size = 40))
                 mirror.draw_rect(x, 2, color_width, color_height, (128,128,128))
             x_start += slot_width + slot_spacing
             index += 1
+        mirror.blit_images(blits)
 
 
+    def frame_signature(self, device: Device) -> tuple:
+        """Get a signature of everything we show on the display. As long as the signature
+        is unchanged, the last frame can be blitted again instead of drawn.
+
+        Args:
+            device (Device): The printer
+
+        Returns:
+            tuple: Frame signature
+        """
+        ams_signature: tuple|None = None
+        if device.ams and len(device.ams.data) > 0 and device.ams.data[0] is not None:
+            ams_signature = (len(device.ams.data), device.ams.data[0].humidity_index, device.ams.tray_now,
+                             tuple((tray.name, tray.color, tray.empty) for tray in device.ams.data[0].tray))
+        elapsed_minutes: int|None = None
+        if self._print_job_start_epoch is not None:
+            elapsed: int = int(time.time()) - self._print_job_start_epoch
+            elapsed_minutes = elapsed // 60 if elapsed > 0 else -1
+        temperatures: tuple = tuple(None if t is None else int(t) for t in (device.temperature.nozzle_temp,
+                                                                             device.temperature.target_nozzle_temp,
+                                                                             device.temperature.bed_temp,
+                                                                             device.temperature.target_bed_temp))
+        print_job: PrintJob = device.print_job
+        return (self._cloud_connected, self._qr_code is not None, self._print_job is not None,
+                self._cover_downloaded, self._cover_image is not None, elapsed_minutes,
+                device.stage.description, print_job.print_type, print_job.subtask_name,
+                print_job.current_layer, print_job.total_layers, print_job.print_percentage,
+                print_job.remaining_time, temperatures, ams_signature)
+
     def draw(self, mirror: pymirror.Mirror):
         font_size: int = 100
         font_size_small: int = 70
@@ -292,11 +573,10 @@ class BambuDisplay:
         layer_y_pos: int = 1100
         time_y_pos: int = 1300
 
-        if not self._cloud_connected:
-            mirror.blit_image(self._qr_code, (mirror.width - qr_code_width) // 2, cover_y_pos)
-            mirror.draw_text("Scan to log in to Bambu Cloud", mirror.width//2, cover_y_pos + qr_code_width + 50, adjustment = pymirror.Adjustment.Center, size = font_size_small)
-
         if not self._client or not self._client.connected:
+            if self._cloud_connected is False and self._qr_code:
+                mirror.blit_image(self._qr_code, (mirror.width - qr_code_width) // 2, cover_y_pos)
+                self.draw_text_cached(mirror, "Scan to log in to Bambu Cloud", mirror.width//2, cover_y_pos + qr_code_width + 50, adjustment = pymirror.Adjustment.Center, size = font_size_small)
             # Show weather forecast in case there is nothing printing
             #global weather_mod
             #global xkcd_mod
@@ -308,32 +588,36 @@ class BambuDisplay:
 
         #mirror.blit_image(self._qr_code, mirror.width - qr_code_width - 20, mirror.height - qr_code_width - 180)
 
-        self.draw_ams(mirror)
-
-        device: Device = self._client.get_device()
+        device: Device|None = self._client.get_device()
+        if not device:
+            return
+        print_job: PrintJob|None = device.print_job
+        temperature = device.temperature
 
         if self._print_job:
             logger.debug(f"Job: {self._print_job}")
-        if self._print_job is None and device.print_job is not None and device.print_job.gcode_state not in ("IDLE", "FINISH", "FAILED"):
+        if self._print_job is None and print_job is not None and print_job.gcode_state not in ("IDLE", "FINISH", "FAILED"):
             logger.info(f"New print job started")
-            self._print_job = device.print_job
+            self._print_job = print_job
             if not self._cover_downloaded:
                 self._cover_image = None
                 t = threading.Thread(target=bambu_download_cover_thread, args=(self,))
                 t.isDaemon = False
                 t.start()
-            self._first_print_job_start = device.print_job.start_time
-            self._print_job_start = device.print_job.start_time if device.print_job.start_time else datetime.datetime.now()
-        elif self._print_job is not None and (device.print_job is None or device.print_job.gcode_state in ("IDLE", "FINISH", "FAILED")):
+            self._first_print_job_start = print_job.start_time
+            self._print_job_start = print_job.start_time if print_job.start_time else datetime.datetime.now()
+            self._print_job_start_epoch = int(self._print_job_start.timestamp())
+        elif self._print_job is not None and (print_job is None or print_job.gcode_state in ("IDLE", "FINISH", "FAILED")):
             logger.info("Print job ended")
             self._cover_downloaded = False
             self._cover_image = None
-            self._print_job = self._print_job_start = None
+            self._print_job = self._print_job_start = self._print_job_start_epoch = None
 
-        if self._first_print_job_start is None and device.print_job.start_time is not None:
+        if self._first_print_job_start is None and print_job.start_time is not None:
             # Sometimes the first start time is None
             logger.debug("Got updated start time")
-            self._first_print_job_start = self._print_job_start = device.print_job.start_time
+            self._first_print_job_start = self._print_job_start = print_job.start_time
+            self._print_job_start_epoch = int(self._print_job_start.timestamp())
 
         if device.hms.error_count > 0:
             logging.error(f"HMS: {device.hms}")
@@ -342,22 +626,41 @@ class BambuDisplay:
         if device.print_error.on:
             logging.error(f"Print Error: {device.print_error}")
 
-        nozzle_temp: int|None = device.temperature.nozzle_temp
-        nozzle_target_temp: int|None = device.temperature.target_nozzle_temp
-        bed_temp: int|None = device.temperature.bed_temp
-        bed_target_temp: int|None = device.temperature.target_bed_temp
+        signature: tuple = self.frame_signature(device)
+        if signature == self._frame_signature:
+            self._frame.flush()
+            return
+        self._frame_signature = signature
+        self._frame.clear()
+        mirror = self._frame
+
+        # Bind what we use over and over again to locals
+        width: int = mirror.width
+        center_x: int = width // 2
+        center: pymirror.Adjustment = pymirror.Adjustment.Center
+        left: pymirror.Adjustment = pymirror.Adjustment.Left
+        right: pymirror.Adjustment = pymirror.Adjustment.Right
+        draw_text: Callable = self.draw_text_cached
+        blit_image: Callable = mirror.blit_image
+
+        self.draw_ams(mirror, device)
+
+        nozzle_temp: int|None = temperature.nozzle_temp
+        nozzle_target_temp: int|None = temperature.target_nozzle_temp
+        bed_temp: int|None = temperature.bed_temp
+        bed_target_temp: int|None = temperature.target_bed_temp
         color_heating: tuple[int, int, int] = (255,0,0)
         color_cooling: tuple[int, int, int] = (0,196,255)
         heat_limit: int = 45  # Use white text when temperature below this limit
 
         current_state: str|None = device.stage.description
         if current_state:
-            if device.print_job.print_type == "idle":
+            if print_job.print_type == "idle":
                 # If aborting during headbed preheating, `device.stage.description` might still say
                 # "Headbead preheating"
-                current_state = device.print_job.print_type
-            current_state = current_state.replace("_", " ").title()
-            mirror.draw_text(current_state, mirror.width/2, state_y_pos, adjustment = pymirror.Adjustment.Center, size = font_size_small)
+                current_state = print_job.print_type
+            current_state = current_state.translate(_UNDERSCORE_TBL).title()
+            draw_text(mirror, current_state, center_x, state_y_pos, adjustment = center, size = font_size_small)
 
         if nozzle_temp is not None:
             nozzle_temp = int(nozzle_temp)
@@ -368,8 +671,8 @@ class BambuDisplay:
                     color = color_heating
                 elif nozzle_target_temp < nozzle_temp and nozzle_temp > heat_limit:
                     color = color_cooling
-            mirror.blit_image(self._extruder_icon, 100, temp_y_pos)
-            mirror.draw_text(f"{nozzle_temp}°", 250, temp_y_pos+10, color, adjustment = pymirror.Adjustment.Left, size = font_size)
+            blit_image(self._extruder_icon, 100, temp_y_pos)
+            draw_text(mirror, f"{nozzle_temp}°", 250, temp_y_pos+10, color, adjustment = left, size = font_size)
             # TODO: Handle target as "warming up" or "cooling down"
         if bed_temp is not None:
             bed_temp = int(bed_temp)
@@ -380,126 +683,50 @@ class BambuDisplay:
                     color = color_heating
                 elif bed_target_temp < bed_temp and bed_temp > heat_limit:
                     color = color_cooling
-            mirror.blit_image(self._bed_icon, mirror.width - 430, temp_y_pos-10)
-            mirror.draw_text(f"{bed_temp}°", mirror.width - 270, temp_y_pos+10, color, adjustment = pymirror.Adjustment.Left, size = font_size)
+            blit_image(self._bed_icon, width - 430, temp_y_pos-10)
+            draw_text(mirror, f"{bed_temp}°", width - 270, temp_y_pos+10, color, adjustment = left, size = font_size)
 
         # Only draw temperature and time unless we're idle
         #if device.stage.description == "idle":
         if not self._cloud_connected:
-            mirror.blit_image(self._qr_code, (mirror.width - qr_code_width) // 2, cover_y_pos)
-            mirror.draw_text("Scan to log in to Bambu Cloud", mirror.width//2, cover_y_pos + qr_code_width + 50, adjustment = pymirror.Adjustment.Center, size = font_size_small)
-            return
-
-        if self._print_job is not None:
-            file_name: str = device.print_job.subtask_name.replace("_", " ")
-            mirror.draw_text(f"{file_name}", mirror.width/2, job_name_y_pos, adjustment = pymirror.Adjustment.Center, size = font_size_small, width=mirror.width-200)
+            # No QR code until we know we are logged out
+            if self._cloud_connected is False and self._qr_code:
+                blit_image(self._qr_code, (width - qr_code_width) // 2, cover_y_pos)
+                draw_text(mirror, "Scan to log in to Bambu Cloud", center_x, cover_y_pos + qr_code_width + 50, adjustment = center, size = font_size_small)
+        elif self._print_job is not None:
+            file_name: str = print_job.subtask_name.translate(_UNDERSCORE_TBL)
+            draw_text(mirror, f"{file_name}", center_x, job_name_y_pos, adjustment = center, size = font_size_small, width=width-200)
 
             if self._cover_image:
-                mirror.blit_image(self._cover_image, (mirror.width - self._cover_w) // 2, cover_y_pos)
+                blit_image(self._cover_image, (width - self._cover_w) // 2, cover_y_pos)
 
-            current_layer: int = device.print_job.current_layer
-            layer_count: int = device.print_job.total_layers
-            progress: int = device.print_job.print_percentage
-            mirror.draw_text(f"Layer {current_layer} of {layer_count} ({progress}%)", mirror.width/2, layer_y_pos, adjustment = pymirror.Adjustment.Center, size = font_size_small)
+            current_layer: int = print_job.current_layer
+            layer_count: int = print_job.total_layers
+            progress: int = print_job.print_percentage
+            draw_text(mirror, f"Layer {current_layer} of {layer_count} ({progress}%)", center_x, layer_y_pos, adjustment = center, size = font_size_small)
 
-            remaining_time: int = device.print_job.remaining_time
+            remaining_time: int = print_job.remaining_time
             remaining_time = int(remaining_time)
             remaining_time *= 60
-            mirror.draw_text("Remaining", mirror.width-50, time_y_pos-font_size_small, adjustment = pymirror.Adjustment.Right, size = 50)
+            draw_text(mirror, "Remaining", width-50, time_y_pos-font_size_small, adjustment = right, size = 50)
             if remaining_time > 0:
-                mirror.draw_text(self.timestamp_to_hms(remaining_time, skip_seconds=True, counting_down=True), mirror.width-50, time_y_pos, adjustment = pymirror.Adjustment.Right, size = font_size_small)
+                draw_text(mirror, self.timestamp_to_hms(remaining_time, skip_seconds=True, counting_down=True), width-50, time_y_pos, adjustment = right, size = font_size_small)
             else:
-                mirror.draw_text("Any second now", mirror.width-50, time_y_pos, adjustment = pymirror.Adjustment.Right, size = font_size_small)
-
-            if self._print_job_start:
-                mirror.draw_text("Elapsed", mirror.width/2-100, time_y_pos-font_size_small, adjustment = pymirror.Adjustment.Right, size = 50)
-                print_start_time = int(time.mktime(self._print_job_start.timetuple()))
-                mirror.draw_text(self.timestamp_to_hms(int(time.time()) - print_start_time, skip_seconds=True), mirror.width/2-100, time_y_pos, adjustment = pymirror.Adjustment.Right, size = font_size_small)
+                draw_text(mirror, "Any second now", width-50, time_y_pos, adjustment = right, size = font_size_small)
 
-            if self._cover_downloaded and self._cover_image is None:
-                # Load cover last as it may take time to scale it
-                (self._cover_image, self._cover_w, self._cover_h) = mirror.load_image(self._cover_fname, 512)
-                logger.info(f"Cover loaded")
+            if self._print_job_start_epoch is not None:
+                draw_text(mirror, "Elapsed", center_x-100, time_y_pos-font_size_small, adjustment = right, size = 50)
+                draw_text(mirror, self.timestamp_to_hms(int(time.time()) - self._print_job_start_epoch, skip_seconds=True), center_x-100, time_y_pos, adjustment = right, size = font_size_small)
 
+        self._frame.flush()
         return
 
 
-    #    if estimated_print_time is not None:
-    #        logger.debug("  Estimated       %d", estimated_print_time)
-    #    if last_print_time is not None:
-    #        logger.debug("  Last            %d", last_print_time)
-
-        if 0:  # TODO: is this interesting to show?
-            if filemant_length is not None:
-                if filemant_length > 1000:
-                    msg = "%dm" % round(filemant_length/1000.0)
-                elif filemant_length > 100:
-                    msg = "%dcm" % round(filemant_length/100.0)
-                elif filemant_length > 10:
-                    msg = "%ddm" % round(filemant_length/10.0)
-                else:
-                    msg = "%dmm" % (filemant_length/1)
-                mirror.draw_text(msg + " of filament required", mirror.width/2, 1300, adjustment = pymirror.Adjustment.Center, size = 100)
-
-
-
 def init(mirror: pymirror.Mirror, config: dict):
 
     logger.info(f"Hello world from the BambuLab module with config {config}")
     return BambuDisplay(mirror, config)
 
-    if "weather_and_xkcd" in info:
-        # This is a bit hackish. We load other modules from here and display them
-        # manually when the 3D printer is idle.
-        weather_conf = {
-            "mqtt_host": "127.0.0.1",
-            "text_size": 40,
-            "skip_night": True
-        }
-        weather_mod = pymirror.Module(mirror, "Weather", "modules/weather", weather_conf, 0, 0, -1, 400)
-        weather_mod.load()
-        weather_mod.locals = weather_mod._module.init(mirror, weather_conf)
-
-        xkcd_conf = {
-            "image_name": "../xkcdScience.png",
-            "x_offset": 350,
-            "y_offset": 550,
-            "height": 500,
-            "width": 500,
-            "invert": False
-        }
-        xkcd_mod = pymirror.Module(mirror, "XKCD", "modules/pngimage.py", xkcd_conf, 550, 350, 500, 500)
-        xkcd_globals = xkcd_mod.load()
-        xkcd_mod.locals = xkcd_mod._module.init(mirror, xkcd_conf)
-
-    config = {
-        "host": host,
-        "access_code": access_code,
-        "local_mqtt": True,
-        "device_type": device_type,
-        "serial": serial,
-        "username": username,
-        "enable_camera": False,
-        "region": info["region"],
-        "email": info["email"],
-        "username": info["username"],
-        "password": info["password"],
-        "auth_token_file": info["auth_token_path"],
-    }
-    logger.warning(f"Bambu config: {config}")
-    client: bambulab.pybambu.BambuClient = bambulab.pybambu.BambuClient(config)
-    # TODO: Attempt cloud connection and if failing, display a QR code leading to a remi app to enter the auth code
-    asyncio.run(bambu_connect(client))
-
-    return {"state": None,
-            "counter": 0,
-            "print_job": None,
-            "client": client,
-            "cover_downloaded": False,
-            "remi_thread": remi_thread,
-            "qr_code": qr_code,
-            }
-
 def draw(mirror: pymirror.Mirror, bambu_display: BambuDisplay):
     bambu_display.draw(mirror)
 
@@ -516,21 +743,3 @@ def get_debug_info(locals: dict) -> dict:
     #if weather_mod and xkcd_mod:
     #    weather_debug = weather_mod._module.get_debug_info(None)
     return None
-    return {
-        "last_topic_time": last_topic_time,
-        "state": state,
-        "extruder_temp": extruder_temp,
-        "extruder_target": extruder_target,
-        "bed_temp": bed_temp,
-        "bed_target": bed_target,
-        "state": state,
-        "progress": progress,
-        "print_time": print_time,
-        "remaining_time": remaining_time,
-        "estimated_print_time": estimated_print_time,
-        "last_print_time": last_print_time,
-        "file_name": file_name,
-        "filemant_length": filemant_length,
-        "weather_active": state is None or state == "",
-        "weather_debug": weather_debug
-    }
@@ -2,10 +2,16 @@
 
 """Demonstrate usage of the generic dialog, starting a thread when dismissed."""
 
+import atexit
+import concurrent.futures
 import logging
+import os
 import threading
 import time
+from dataclasses import dataclass
 from enum import Enum
+from pathlib import Path
+from typing import Callable, NamedTuple
 
 import remi
 import remi.gui as gui
@@ -19,7 +25,11 @@ from bambulab.bambudisplay import BambuDisplay
 
 logger = logging.getLogger(__name__)
 
-_bambu_display: BambuDisplay
+_bambu_display: BambuDisplay|None = None  # Set once by `start` before the REMI server starts
+
+# Blocking cloud calls run here, keeping the REMI thread free meanwhile. One at a time
+# as the cloud client is not thread safe.
+cloud_executor: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="bambu-cloud")
 
 #    auth_token: str|None = None
 #    token_path: Path = Path.home() / info["auth_toke_file"]
@@ -35,31 +45,92 @@ class CloudState(Enum):
     LOGGED_IN = 5
     BLOCKED = 6
 
+# Static parts of the UI, shared by all app instances
+@dataclass(frozen=True, slots=True)
+class WidgetSpec:
+    """Size and margin of a widget"""
+    width: int
+    height: int
+    margin: str
+
+label_spec: WidgetSpec = WidgetSpec(200, 30, "10px")
+button_spec: WidgetSpec = WidgetSpec(150, 30, "10px")
+text_input_spec: WidgetSpec = WidgetSpec(150, 30, "10px")
+
+state_labels: dict[CloudState, str] = {
+    CloudState.UNKNOWN: "Unknown state",
+    CloudState.LOGGED_OUT: "Logged out",
+    CloudState.CODE_SENT: "Enter authentication code",
+    CloudState.LOGGING_IN: "Logging in",
+    CloudState.LOGGED_IN: "Logged in",
+    CloudState.BLOCKED: "Blocked by CloudFlare",
+}
+
+# What the mirror shows in each cloud state, None shows neither login QR code nor print job
+display_connected: dict[CloudState, bool|None] = {
+    CloudState.UNKNOWN: None,
+    CloudState.LOGGED_OUT: False,
+    CloudState.CODE_SENT: False,
+    CloudState.LOGGING_IN: None,
+    CloudState.LOGGED_IN: True,
+    CloudState.BLOCKED: False,
+}
+
+class StateSpec(NamedTuple):
+    """What the UI shows in a cloud state"""
+    label: str
+    top_widgets: tuple[gui.Widget, ...]
+    bottom_widgets: tuple[gui.Widget, ...]
+    spinner: bool
+
 class MyApp(App):
     def __init__(self, *args):
         self.init: bool = False
         self.cloud_state: CloudState = CloudState.UNKNOWN
+        self.cloud_message: str|None = None  # Shown instead of the state label when set
+        self.state_lock: threading.Lock = threading.Lock()  # Cloud state is changed from worker threads too
         super(MyApp, self).__init__(*args)
 
     def do_init(self):
         if self.init:
             return
         """Do init of this object, see comment at the of of file why this is needed"""
-        self.bambu_display: BambuDisplay = _bambu_display
-        self.client: pybambu.BambuClient = self.bambu_display._client
+        # Skip the logging call altogether when debug logging is off
+        self.log_debug: Callable = logger.debug if logger.isEnabledFor(logging.DEBUG) else (lambda *args, **kwargs: None)
+        bambu_display: BambuDisplay = _bambu_display
+        self.bambu_display: BambuDisplay = bambu_display
+        self.client: pybambu.BambuClient = bambu_display._client
         self.cloud: pybambu.BambuCloud = self.client.bambu_cloud
-        self.update_cloud_state()
+        self.build_ui()
+        self.run_cloud_call(self.update_cloud_state)
         self.init = True
 
-    def set_cloud_state(self, new_state: CloudState):
-        logger.debug(f"Changing cloud state from {self.cloud_state} -> {new_state}")
-        self.cloud_state = new_state
-        self.bambu_display._cloud_connected = self.cloud_state == CloudState.LOGGED_IN
+    def set_cloud_state(self, new_state: CloudState, message: str|None = None):
+        """Change cloud state
+
+        Args:
+            new_state (CloudState): The new state
+            message (str|None, optional): Shown instead of the state label. Defaults to None.
+        """
+        with self.state_lock:
+            self.log_debug("Changing cloud state from %s -> %s", self.cloud_state, new_state)
+            self.cloud_state = new_state
+            self.cloud_message = message
+            self.bambu_display._cloud_connected = display_connected[new_state]
 
     def update_cloud_state(self):
+        """Check if we are logged in to the cloud and update the UI, runs on `cloud_executor`"""
         logger.info("☁️  Updating cloud status ☁️")
         self.set_cloud_state(CloudState.UNKNOWN)
 
+        # Without a token there is no point in asking the cloud, we know the answer
+        token_path: Path = self.bambu_display._token_path
+        if not getattr(self.cloud, "_auth_token", None) and (not token_path.is_file() or token_path.stat().st_size == 0):
+            logger.info("No auth token, not logged in to Bambulab cloud")
+            self.set_cloud_state(CloudState.LOGGED_OUT)
+            self.update_ui()
+            return
+
         try:
             devices: list[dict[str: str|int]] = self.cloud.get_device_list()
         except ValueError as e:
@@ -71,85 +142,141 @@ class MyApp(App):
                 logger.error("Not authenticated with Bambulab cloud API")
             else:
                 self.set_cloud_state(CloudState.LOGGED_IN)
-                logger.debug(f"Cloud Devices: {devices}")
+                self.log_debug("Cloud Devices: %s", devices)
                 if len(devices) > 0:
                     name = f"{devices[0]['name']} is connected"
+        self.update_ui()
 
-    def update_ui(self):
-        self.main_container.empty()
-        self.top_container.empty()
-        self.bottom_container.empty()
-        self.main_container.append(self.top_label)
-        self.spinner.stop()
-
-        match self.cloud_state:
-            case CloudState.UNKNOWN:
-                self.top_label.set_text("Unknown state")
-            case CloudState.LOGGED_OUT:
-                self.top_label.set_text("Logged out")
-                self.bottom_container.append(self.log_in_button)
-            case CloudState.CODE_SENT:
-                self.top_label.set_text("Enter authentication code")
-                self.top_container.append(self.auto_code_field)
-                self.bottom_container.append(self.enter_code_button)
-            case CloudState.LOGGING_IN:
-                self.top_label.set_text("Logging in")
-                self.top_container.append(self.spinner)
-                self.spinner.start()
-            case CloudState.LOGGED_IN:
-                self.top_label.set_text("Logged in")
-                self.bottom_container.append(self.log_out_button)
-            case CloudState.BLOCKED:
-                self.top_label.set_text("Blocked by CloudFlare")
-                self.bottom_container.append(self.log_in_button)
-        self.main_container.append([self.top_container, self.bottom_container])
-
-    def main(self):
-        logger.info("MyApp main")
-        if not self.init:
-            self.do_init()
-
-        self.update_cloud_state()
+    def build_ui(self):
+        """Build the widget tree once, `update_ui` then only toggles what is visible"""
         #self.container = gui.Container(width = 540, margin = "0px auto", style = {"display": "block", "overflow": "hidden"})
         self.main_container = gui.VBox()
         self.top_container = gui.HBox()
         self.bottom_container = gui.HBox()
 
-        self.top_label = gui.Label("", width=200, height=30, margin="10px")
+        self.top_label = gui.Label("", width=label_spec.width, height=label_spec.height, margin=label_spec.margin)
 
-        self.log_in_button = gui.Button("Log In", width=150, height=30, margin="10px")
+        self.log_in_button = gui.Button("Log In", width=button_spec.width, height=button_spec.height, margin=button_spec.margin)
         self.log_in_button.onclick.do(self.login_button_pressed)
 
-        self.send_code_button = gui.Button("Send Code", width=150, height=30, margin="10px")
+        self.send_code_button = gui.Button("Send Code", width=button_spec.width, height=button_spec.height, margin=button_spec.margin)
         self.send_code_button.onclick.do(self.send_code_button_pressed)
 
-        self.enter_code_button = gui.Button("OK", width=150, height=30, margin="10px")
+        self.enter_code_button = gui.Button("OK", width=button_spec.width, height=button_spec.height, margin=button_spec.margin)
         self.enter_code_button.onclick.do(self.enter_code_button_pressed)
 
-        self.log_out_button = gui.Button("Log Out", width=150, height=30, margin="10px")
+        self.log_out_button = gui.Button("Log Out", width=button_spec.width, height=button_spec.height, margin=button_spec.margin)
         self.log_out_button.onclick.do(self.logout_button_pressed)
 
-        self.auto_code_field = gui.TextInput(width=150, height=30, margin="10px")
+        self.auto_code_field = gui.TextInput(width=text_input_spec.width, height=text_input_spec.height, margin=text_input_spec.margin)
 
         self.spinner = gui.Spinner(size = 20, color = "#000")
 
+        self.top_container.append([self.auto_code_field, self.spinner])
+        self.bottom_container.append([self.log_in_button, self.enter_code_button, self.log_out_button])
+        self.main_container.append([self.top_label, self.top_container, self.bottom_container])
+
+        self.last_rendered_state: tuple[CloudState, str|None]|None = None
+        self.spinner_on: bool = False  # Stopping a stopped spinner still sends an update
+
+        # Widgets not listed for a state are hidden
+        self.state_specs: dict[CloudState, StateSpec] = {
+            CloudState.UNKNOWN: StateSpec(state_labels[CloudState.UNKNOWN], (), (), False),
+            CloudState.LOGGED_OUT: StateSpec(state_labels[CloudState.LOGGED_OUT], (), (self.log_in_button,), False),
+            CloudState.CODE_SENT: StateSpec(state_labels[CloudState.CODE_SENT], (self.auto_code_field,), (self.enter_code_button,), False),
+            CloudState.LOGGING_IN: StateSpec(state_labels[CloudState.LOGGING_IN], (self.spinner,), (), True),
+            CloudState.LOGGED_IN: StateSpec(state_labels[CloudState.LOGGED_IN], (), (self.log_out_button,), False),
+            CloudState.BLOCKED: StateSpec(state_labels[CloudState.BLOCKED], (), (self.log_in_button,), False),
+        }
+
+    def show_only(self, container: gui.Container, widgets: tuple[gui.Widget, ...]):
+        """Show `widgets` and hide all other children of `container`"""
+        for widget in container.children.values():
+            if widget in widgets:
+                widget.style.pop("display", None)  # Back to the default display of the widget
+            else:
+                widget.style["display"] = "none"
+
+    def update_ui(self):
+        # Holding the update lock makes REMI send all changes below as one update
+        with self.update_lock:
+            if (self.cloud_state, self.cloud_message) == self.last_rendered_state:
+                return
+            self.last_rendered_state = (self.cloud_state, self.cloud_message)
+            spec: StateSpec = self.state_specs[self.cloud_state]
+            self.top_label.set_text(self.cloud_message or spec.label)
+            self.show_only(self.top_container, spec.top_widgets)
+            self.show_only(self.bottom_container, spec.bottom_widgets)
+            if spec.spinner != self.spinner_on:
+                if spec.spinner:
+                    self.spinner.start()
+                else:
+                    self.spinner.stop()
+                self.spinner_on = spec.spinner
+
+    def main(self):
+        logger.info("MyApp main")
+        if not self.init:
+            self.do_init()  # Checks the cloud state
         self.update_ui()
         return self.main_container
 
+    def run_cloud_call(self, func: Callable, *args) -> concurrent.futures.Future:
+        """Run a blocking cloud call on `cloud_executor`, keeping the REMI thread free to serve
+        other clients meanwhile
+
+        Args:
+            func (Callable): Function to call
+            *args: Arguments to `func`
+
+        Returns:
+            concurrent.futures.Future: Future for the result of `func`
+        """
+        future: concurrent.futures.Future = cloud_executor.submit(func, *args)
+        future.add_done_callback(self.cloud_call_done)
+        return future
+
+    def cloud_call_done(self, future: concurrent.futures.Future):
+        """Make sure a failed or cancelled cloud call does not leave the UI waiting forever.
+        Only authentication failures log us out, eg. network errors say nothing about our token."""
+        if future.cancelled():
+            logger.error("Cloud call cancelled")
+            self.set_cloud_state(CloudState.UNKNOWN)
+        elif future.exception():
+            e: BaseException = future.exception()
+            logger.error("Cloud call caused exception", exc_info=e)
+            # pybambu raises ValueError when not authenticated
+            self.set_cloud_state(CloudState.LOGGED_OUT if isinstance(e, ValueError) else CloudState.UNKNOWN)
+        else:
+            return
+        self.update_ui()
+
     def login_button_pressed(self, widget: gui.Widget):
         logger.info("Login button pressed")
-        region: str = self.bambu_display._region
-        email: str = self.bambu_display._email
-        password: str = self.bambu_display._password
+        self.set_cloud_state(CloudState.LOGGING_IN)
+        self.update_ui()
+        # Logging in may take seconds, keep the UI responsive meanwhile
+        self.run_cloud_call(self.login_worker)
+
+    def login_worker(self):
+        """Log in to the Bambu cloud, runs on `cloud_executor`"""
+        bambu_display: BambuDisplay = self.bambu_display
+        cloud: pybambu.BambuCloud = self.cloud
+        (region, email, password) = (bambu_display._region, bambu_display._email, bambu_display._password)
         try:
-            self.cloud.login(region, email, password)
+            cloud.login(region, email, password)
         except pybambu.bambu_cloud.CloudflareError:
             logger.error(f"Blocked by Cloudflare, sorry")
             self.set_cloud_state(CloudState.BLOCKED)
         except pybambu.bambu_cloud.EmailCodeRequiredError:
             logger.info(f"Getting email verification code")
-            self.cloud._get_email_verification_code()
+            cloud._get_email_verification_code()
             self.set_cloud_state(CloudState.CODE_SENT)
+        except Exception as e:
+            logger.error("Login caused exception", exc_info=e)
+            self.set_cloud_state(CloudState.LOGGED_OUT)
+        else:
+            self.set_cloud_state(CloudState.LOGGED_IN)
         self.update_ui()
 
     def logout_button_pressed(self, widget: gui.Widget):
@@ -167,26 +294,57 @@ class MyApp(App):
         self.set_cloud_state(CloudState.LOGGING_IN)
         self.update_ui()
         code: str = self.auto_code_field.get_text()
+        self.run_cloud_call(self.enter_code_worker, code)
+
+    def enter_code_worker(self, code: str):
+        """Log in to the Bambu cloud using the email verification code, runs on `cloud_executor`
+
+        Args:
+            code (str): Verification code
+        """
         logger.info(f"Using code {code}")
+        cloud: pybambu.BambuCloud = self.cloud
         try:
-            self.cloud.login_with_verification_code(code)
-            token = self.cloud._auth_token
+            cloud.login_with_verification_code(code)
+            token = cloud._auth_token
             logger.info("Got new token")
-            with open(self.bambu_display._token_path, "w+") as f:
+            # Write to a temporary file and rename so a crash never leaves a truncated token behind
+            token_path: Path = self.bambu_display._token_path
+            tmp_path: Path = token_path.with_name(token_path.name + ".tmp")
+            with open(tmp_path, "w") as f:
                 f.write(token)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, token_path)
             self.set_cloud_state(CloudState.LOGGED_IN)
         except pybambu.bambu_cloud.EmailCodeExpiredError:
             logger.info("Email code expired, requesting new.")
-            self.cloud.bambu_cloud._get_email_verification_code()
+            cloud._get_email_verification_code()
             self.set_cloud_state(CloudState.CODE_SENT)
         except ValueError:
-            self.top_label.set_text("Failed to verify code, requested new")
-            self.cloud.bambu_cloud._get_email_verification_code()
-            self.set_cloud_state(CloudState.CODE_SENT)
+            cloud._get_email_verification_code()
+            self.set_cloud_state(CloudState.CODE_SENT, "Failed to verify code, requested new")
         except pybambu.bambu_cloud.EmailCodeIncorrectError:
-            self.top_label.set_text("Incorrect code, try again")
+            self.set_cloud_state(CloudState.CODE_SENT, "Incorrect code, try again")
+        except Exception as e:
+            logger.error("Login with verification code caused exception", exc_info=e)
+            self.set_cloud_state(CloudState.LOGGED_OUT)
         self.update_ui()
 
+def close_cloud_connections():
+    """Close the pooled cloud connections and the printer connection on exit, leaving no
+    sockets behind when restarting"""
+    if _bambu_display is None:
+        return
+    client: pybambu.BambuClient = _bambu_display._client
+    session = getattr(client.bambu_cloud, "_session", None)
+    if session is not None:
+        session.close()
+    try:
+        client.disconnect()
+    except Exception as e:
+        logger.error("Failed to disconnect from printer", exc_info=e)
+
 def start(bambu_display: BambuDisplay, port: int):
     # I am not too happy about the life cycle of the REMI apps.
     # The application object is created when a client accesses
@@ -194,10 +352,12 @@ def start(bambu_display: BambuDisplay, port: int):
     # set `bambu_module` as an argument to the MyApp constructor.
     global _bambu_display
     _bambu_display = bambu_display
+    atexit.register(close_cloud_connections)
     remi.start(MyApp,
                 title = "Workshop Bambu Mirror",
                 debug = False,
                 address = "0.0.0.0",
                 port = port,
                 start_browser = False,
+                update_interval = 0.5,  # Our UI changes rarely, no need to look for changes 10 times a second
             )